@@ -1,14 +1,25 @@
 """Gamma Vacuum SPCe model utility functions."""
+import asyncio
 import errno
+import functools
+import math
 import time
 import socket
 import re
-from typing import Union
+from typing import List, Tuple, Union
 
 from hardware_device_base import HardwareSensorBase
 
+try:
+    from fastrlock.rlock import FastRLock
+except ImportError:
+    FastRLock = None  # pylint: disable=invalid-name
+
 # Constants (partial, extend as needed)
 SPCE_TIME_BETWEEN_COMMANDS = 0.12
+SPCE_KEEPALIVE_IDLE = 10      # seconds idle before the first keepalive probe
+SPCE_KEEPALIVE_INTERVAL = 5   # seconds between keepalive probes
+SPCE_KEEPALIVE_COUNT = 3      # failed probes before the connection is dropped
 
 # Command codes (extend as needed)
 SPCE_COMMAND_READ_MODEL = 0x01
@@ -44,10 +55,22 @@ SPCE_UNITS_TORR = 'T'
 SPCE_UNITS_MBAR = 'M'
 SPCE_UNITS_PASCAL = 'P'
 
+# Fallback patterns for response values that don't convert directly
+_FLOAT_RE = re.compile(r"([-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?)")
+_INT_RE = re.compile(r"([-+]?[0-9]+)")
+
 
 class SpceController(HardwareSensorBase):
     """Class to control a Lesker GAMMA gauge SPCe controller over a TCP socket."""
-    # pylint: disable=too-many-public-methods
+    # pylint: disable=too-many-public-methods,too-many-instance-attributes
+
+    # Minimum time in seconds between transmissions, 0.0 disables pacing.
+    # Set to SPCE_TIME_BETWEEN_COMMANDS if a controller needs the old fixed gap.
+    min_gap = 0.0
+
+    # Maximum number of requests written before their replies are read in send_many.
+    # Defaults to 1 (no pipelining) until SPCe firmware support is verified.
+    max_in_flight = 1
 
     def __init__(self, bus_address: int =1, simulate: bool =False,
                  log: bool =True, logfile: str = __name__.rsplit(".", 1)[-1] ) -> None:
@@ -63,11 +86,19 @@ class SpceController(HardwareSensorBase):
         """
         super().__init__(log, logfile)
 
+        # Use the cheaper uncontended lock when fastrlock is installed
+        if FastRLock is not None:
+            self.lock = FastRLock()
+
         # Bus address
         self.bus_address = bus_address
 
         # Set up socket
         self.sock = None
+        self._rx_buffer = bytearray()
+        self._rx_chunk = memoryview(bytearray(256))
+        self._rx_stale = False
+        self._last_tx = 0.0
 
         # Simulate mode
         if simulate:
@@ -91,6 +122,7 @@ class SpceController(HardwareSensorBase):
                 if con_type == "tcp":
                     if self.sock is None:
                         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                        self._configure_socket()
                     try:
                         self.sock.connect((host, port))
                         self._set_connected(True)
@@ -135,22 +167,110 @@ class SpceController(HardwareSensorBase):
                 self._set_connected(False)
                 self.sock = None
 
+    def _configure_socket(self):
+        """ Set socket options for a long running controller connection. """
+        # Commands are tiny request/response frames, don't let Nagle hold them
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Detect a dead terminal server instead of timing out on every read
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, SPCE_KEEPALIVE_IDLE)
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                                 SPCE_KEEPALIVE_INTERVAL)
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, SPCE_KEEPALIVE_COUNT)
+
     def _clear_socket(self):
         """ Clear socket buffer. """
-        if self.sock is not None:
-            self.sock.setblocking(False)
+        if self.sock is not None and self._drain_socket():
+            self.sock.settimeout(2.0)
+
+    def _drain_socket(self) -> bool:
+        """ Discard anything waiting on the socket, keeping its current timeout.
+
+        Returns False, and drops the connection, if the controller closed it.
+        """
+        timeout = self.sock.gettimeout()
+        self.sock.setblocking(False)
+        closed = False
+        try:
             while True:
                 try:
-                    _ = self.sock.recv(1024)
+                    if not self.sock.recv(1024):
+                        closed = True
+                        break
                 except BlockingIOError:
                     break
-            self.sock.setblocking(True)
-            self.sock.settimeout(2.0)
+        finally:
+            self.sock.settimeout(timeout)
+        self._rx_buffer.clear()
+        self._rx_stale = False
+        if closed:
+            self.report_error("Connection closed by SPCe controller")
+            self.sock.close()
+            self.sock = None
+            self._set_connected(False)
+        return not closed
+
+    def _discard_late_reply(self):
+        """ Drop a partial reply after a timeout and flush again before the next send.
+
+        Replies don't echo the command code, so a reply arriving late would
+        otherwise be taken as the response to the next request.
+        """
+        self._drain_socket()
+        self._rx_stale = True
+
+    def _read_frame(self) -> bytes:
+        """Read one carriage-return terminated frame from the controller.
+
+        Bytes received past the terminator are kept for the next call.
+        If the peer closes the connection, whatever was received is returned.
+        """
+        scan = 0
+        while True:
+            end = self._rx_buffer.find(b'\r', scan)
+            if end >= 0:
+                frame = bytes(self._rx_buffer[:end])
+                del self._rx_buffer[:end + 1]
+                return frame
+            # Only newly received bytes need searching for the terminator
+            scan = len(self._rx_buffer)
+            nbytes = self.sock.recv_into(self._rx_chunk)
+            if hasattr(socket, 'TCP_QUICKACK'):
+                # Linux only, and the kernel clears it again after each ACK
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            if not nbytes:
+                frame = bytes(self._rx_buffer)
+                self._rx_buffer.clear()
+                return frame
+            self._rx_buffer += self._rx_chunk[:nbytes]
+
+    def _wait_min_gap(self):
+        """ Sleep only as long as needed to honor min_gap since the last send. """
+        if self.min_gap > 0.0:
+            delay = self.min_gap - (time.monotonic() - self._last_tx)
+            if delay > 0.0:
+                time.sleep(delay)
+
+    def _transmit(self, frame: bytes) -> bool:
+        """ Write a frame, flushing a stale reply and honoring min_gap first.
+
+        Must be called with the lock held. Returns False if the controller
+        closed the connection.
+        """
+        if self._rx_stale and not self._drain_socket():
+            return False
+        self._wait_min_gap()
+        self.sock.sendall(frame)
+        self._last_tx = time.monotonic()
+        return True
 
-    def _send_command(self, command: str) -> bool:  # pylint: disable=W0221
+    def _send_command(self, command: bytes) -> bool:  # pylint: disable=W0221
         """Send a command without expecting a response.
         Args:
-            command (str): command to send.
+            command (bytes): command to send.
         """
         if not self.is_connected():
             self.report_error("Not connected to SPCe controller.")
@@ -161,9 +281,7 @@ class SpceController(HardwareSensorBase):
             print(f"[SIM SEND] {command}")
             return True
         with self.lock:
-            self.sock.sendall(command.encode('utf-8'))
-            time.sleep(SPCE_TIME_BETWEEN_COMMANDS)
-        return True
+            return self._transmit(command)
 
     def _read_reply(self) -> Union[str, None]:
         """Read a reply from the controller."""
@@ -171,16 +289,16 @@ class SpceController(HardwareSensorBase):
             self.report_error("Not connected to SPCe controller.")
             return None
         try:
-            reply = self.sock.recv(1024).decode('utf-8').strip()
+            reply = self._read_frame().decode('utf-8').strip()
             self.report_debug(f"Received reply {reply}")
             return reply
         except Exception as ex:
             raise IOError(f"Failed to _read_reply message: {ex}") from ex
 
-    def _send_request(self, command: str, response_type: str ="S") -> Union[int, float, str]:
+    def _send_request(self, command: bytes, response_type: str ="S") -> Union[int, float, str]:
         """Send a command and receive a response.
         Args:
-            command (str): Command to send.
+            command (bytes): Command to send.
             response_type (str): Type of response:
                 'I' for int, 'S' for str (default), 'F' for float.
             """
@@ -193,28 +311,82 @@ class SpceController(HardwareSensorBase):
             print(f"[SIM REQ] {command}")
             return "SIM_RESPONSE"
         with self.lock:
-            self.sock.sendall(command.encode('utf-8'))
-            time.sleep(SPCE_TIME_BETWEEN_COMMANDS)
+            if not self._transmit(command):
+                return "NOT CONNECTED"
             try:
-                recv = self.sock.recv(1024)
-                recv_len = len(recv)
-                self.report_debug(f"Return: len = {recv_len}, Value = {recv}")
+                recv = self._read_frame()
             except socket.timeout:
                 self.report_error("Timeout while waiting for response")
+                self._discard_late_reply()
                 return "TIMEOUT"
-            retval = str(recv.decode('utf-8')).strip()
-            if self.validate_response(retval):
-                response_type = response_type.upper()
-                if response_type == "F":
-                    retval = extract_float_from_response(retval)
-                elif response_type == "I":
-                    retval = extract_int_from_response(retval)
-                else:
-                    retval = extract_string_from_response(retval)
-                return retval
-            return "NOT VALID"
+            return self._parse_response(recv, response_type)
+
+    def send_many(self, codes: List[int],
+                  response_type: str ="S") -> List[Union[int, float, str]]:
+        """Send several requests back to back and receive their responses.
 
-    def create_command(self, code, data=None) -> str:
+        Up to max_in_flight requests are written with a single sendall before
+        their responses are read, so a group costs one round trip instead of one
+        per request. With the default of 1 the requests go back to back.
+
+        Args:
+            codes (list): Command codes of requests that take no data.
+            response_type (str): Type of every response, as for _send_request.
+
+        Returns:
+            list: Responses in the same order as codes.
+        """
+        if not self.is_connected():
+            self.report_error("Not connected to SPCe controller.")
+            return ["NOT CONNECTED"] * len(codes)
+
+        if self.max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+        frames = [self.create_command(code) for code in codes]
+        self.report_debug(f"Sending requests {frames}")
+        if self.simulate:
+            print(f"[SIM REQ] {frames}")
+            return ["SIM_RESPONSE"] * len(codes)
+        results = []
+        with self.lock:
+            for start in range(0, len(frames), self.max_in_flight):
+                group = frames[start:start + self.max_in_flight]
+                if not self._transmit(b"".join(group)):
+                    results += ["NOT CONNECTED"] * (len(frames) - len(results))
+                    return results
+                for _ in group:
+                    try:
+                        recv = self._read_frame()
+                    except socket.timeout:
+                        self.report_error("Timeout while waiting for response")
+                        # Replies still owed for this group would shift every later read
+                        self._discard_late_reply()
+                        results += ["TIMEOUT"] * (len(frames) - len(results))
+                        return results
+                    results.append(self._parse_response(recv, response_type))
+        return results
+
+    def _parse_response(self, recv: bytes, response_type: str) -> Union[int, float, str]:
+        """Validate a response frame and convert it to the requested type.
+        Args:
+            recv (bytes): Response frame without the terminator.
+            response_type (str): 'I' for int, 'S' for str, 'F' for float.
+        """
+        self.report_debug(f"Return: len = {len(recv)}, Value = {recv}")
+        recv = recv.strip()
+        if self.validate_response(recv):
+            response_type = response_type.upper()
+            # Numeric values convert straight from bytes, only strings need decoding
+            if response_type == "F":
+                retval = extract_float_from_response(recv)
+            elif response_type == "I":
+                retval = extract_int_from_response(recv)
+            else:
+                retval = extract_string_from_response(recv.decode('utf-8'))
+            return retval
+        return "NOT VALID"
+
+    def create_command(self, code, data=None) -> bytes:
         """Create a properly formatted command string.
 
         Args:
@@ -233,28 +405,30 @@ class SpceController(HardwareSensorBase):
         ba   = address value between 01 and FF.
         cc   = character string representing command (2 bytes).
         data = optional value for command (e.g. baud rate, adress setting, etc.).
-        """
-
-        command = f" {self.bus_address:02X} {code:02X} "
-        if data:
-            command += f"{data} "
 
-        chksm = sum(ord(c) for c in command) % 256
+        Frames for commands without data are cached per bus address and code.
+        """
+        if not data:
+            return _build_frame(self.bus_address, code)
 
-        command = f"~{command}{chksm:02X}\r"
-        return command
+        # Only the data field needs summing, the prefix checksum is cached
+        prefix, chksm = _frame_prefix(self.bus_address, code)
+        data = f"{data} ".encode('ascii')
+        return b"~%s%s%02X\r" % (prefix, data, (chksm + sum(data)) & 0xFF)
 
-    def validate_response(self, response: str) -> bool:
+    def validate_response(self, response: Union[str, bytes]) -> bool:
         """
         Validate the response string from a serial device.
 
         Args:
-            response (str): The raw response string from the device.
+            response (str or bytes): The raw response from the device.
 
         Returns:
             int: 0 if valid, or an error code.
         """
         # pylint: disable=too-many-branches
+        if isinstance(response, str):
+            response = response.encode('utf-8')
 
         try:
             # The First field must be the bus address
@@ -270,12 +444,8 @@ class SpceController(HardwareSensorBase):
         # Now check for error condition or valid response
         substr = response[3:]
 
-        if substr.startswith("ER"):
-            try:
-                error_code_str = substr[3:]
-                self.report_error(error_code_str)
-            except ValueError:
-                pass
+        if substr.startswith(b"ER"):
+            self.report_error(substr[3:].decode('utf-8', 'replace'))
             return False
 
         # Calculate and verify checksum
@@ -287,7 +457,7 @@ class SpceController(HardwareSensorBase):
             return False
 
         # Calculate checksum (sum of all chars before checksum, mod 256)
-        cksm = sum(ord(c) for c in response[:offset+1]) % 256
+        cksm = sum(response[:offset+1]) & 0xFF
 
         if rcksm != cksm:
             self.report_error("Invalid checksum from device.")
@@ -345,6 +515,31 @@ class SpceController(HardwareSensorBase):
         return self._send_request(
             self.create_command(SPCE_COMMAND_READ_VOLTAGE), "F")
 
+    async def read_current_async(self):
+        """Read the emission current without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.read_current)
+
+    async def read_pressure_async(self):
+        """Read the pressure value without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.read_pressure)
+
+    async def read_voltage_async(self):
+        """Read the ion gauge voltage without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(None, self.read_voltage)
+
+    def read_all(self):
+        """Read pressure, current and voltage through send_many.
+
+        The requests are pipelined when max_in_flight allows it.
+
+        Returns:
+            tuple: (pressure, current, voltage)
+        """
+        pressure, current, voltage = self.send_many(
+            [SPCE_COMMAND_READ_PRESSURE, SPCE_COMMAND_READ_CURRENT,
+             SPCE_COMMAND_READ_VOLTAGE], "F")
+        return pressure, current, voltage
+
     def set_units(self, unit_char):
         """Set the pressure display units.
 
@@ -474,20 +669,55 @@ class SpceController(HardwareSensorBase):
         return self._send_request(self.create_command(
             SPCE_COMMAND_SET_COMM_INTERFACE, str(interface)))
 
+@functools.lru_cache(maxsize=256)
+def _frame_prefix(bus_address: int, code: int) -> Tuple[bytes, int]:
+    """Return the encoded ' ba cc ' command fields and their byte sum."""
+    prefix = f" {bus_address:02X} {code:02X} ".encode('ascii')
+    return prefix, sum(prefix)
+
+@functools.lru_cache(maxsize=256)
+def _build_frame(bus_address: int, code: int) -> bytes:
+    """Build the encoded frame for a command that takes no data."""
+    prefix, chksm = _frame_prefix(bus_address, code)
+    return b"~%s%02X\r" % (prefix, chksm & 0xFF)
+
+def _value_field(response):
+    """Return the first field after the OK status of a str or bytes response."""
+    if isinstance(response, bytes):
+        return response.split(b"OK 00 ")[-1].split()[0]
+    return response.split("OK 00 ")[-1].split()[0]
+
 def extract_float_from_response(response):
-    """Extract a float value from the response string."""
-    response = response.split("OK 00 ")[-1].split()[0]
+    """Extract a float value from the response string or bytes."""
+    response = _value_field(response)
+    # float() also takes nan, inf and 1_0, which the regex below doesn't
+    if (b"_" if isinstance(response, bytes) else "_") not in response:
+        try:
+            value = float(response)
+            if math.isfinite(value):
+                return value
+        except ValueError:
+            pass
+    if isinstance(response, bytes):
+        response = response.decode('utf-8', 'replace')
     try:
-        match = re.search(r"([-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?)", response)
+        match = _FLOAT_RE.search(response)
         return float(match.group(1)) if match else None
     except ValueError:
         return None
 
 def extract_int_from_response(response):
-    """Extract an integer value from the response string."""
-    response = response.split("OK 00 ")[-1].split()[0]
+    """Extract an integer value from the response string or bytes."""
+    response = _value_field(response)
+    if (b"_" if isinstance(response, bytes) else "_") not in response:
+        try:
+            return int(response)
+        except ValueError:
+            pass
+    if isinstance(response, bytes):
+        response = response.decode('utf-8', 'replace')
     try:
-        match = re.search(r"([-+]?[0-9]+)", response)
+        match = _INT_RE.search(response)
         return int(match.group(1)) if match else None
     except ValueError:
         return None
@@ -1,6 +1,12 @@
 """Perform basic tests."""
+# pylint: disable=protected-access
+import asyncio
+import socket
+import threading
+import time
 import pytest
-from SPCe import SpceController
+from SPCe import (SpceController, extract_float_from_response,
+                  extract_int_from_response)
 
 def test_initialization():
     """Test initialization."""
@@ -12,3 +18,167 @@ def test_connection_fail():
     controller = SpceController()
     controller.connect(host="127.0.0.1", port=50000)
     assert not controller.connected
+
+def tcp_pair():
+    """Return a connected pair of loopback TCP sockets."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        client = socket.create_connection(server.getsockname())
+        peer, _ = server.accept()
+    return client, peer
+
+def make_reply(value):
+    """Build a checksummed reply frame from bus address 1."""
+    reply = f"01 OK 00 {value} "
+    return f"{reply}{sum(ord(c) for c in reply) % 256:02X}\r".encode('ascii')
+
+def respond_after(peer, *replies):
+    """Send each reply from a background thread once its request arrives."""
+    def run():
+        for reply in replies:
+            peer.recv(1024)
+            peer.sendall(reply)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def recv_frames(peer, count):
+    """Read on the peer until count carriage-return terminated frames arrived."""
+    sent = b""
+    while sent.count(b"\r") < count:
+        sent += peer.recv(1024)
+    return sent
+
+@pytest.fixture(name="link")
+def fixture_link():
+    """Yield a connected controller and the peer end of its loopback socket."""
+    controller = SpceController()
+    client, peer = tcp_pair()
+    controller.sock = client
+    controller._set_connected(True)
+    try:
+        yield controller, peer
+    finally:
+        peer.close()
+        client.close()
+
+def test_read_frame(link):
+    """Test that reads split on the carriage return terminator."""
+    controller, peer = link
+    peer.sendall(b"01 OK 00 1.0E-08 7A\r01 OK 00 ")
+    assert controller._read_frame() == b"01 OK 00 1.0E-08 7A"
+    peer.sendall(b"5.3E-06 9C\r")
+    assert controller._read_frame() == b"01 OK 00 5.3E-06 9C"
+
+def test_timeout_discards_late_reply(link):
+    """Test a reply arriving after a timeout is not handed to the next request."""
+    controller, peer = link
+    controller.sock.settimeout(0.1)
+    late = make_reply("1.0E-08")
+    peer.sendall(late[:8])
+    assert controller.read_pressure() == "TIMEOUT"
+    assert controller.sock.gettimeout() == 0.1
+    peer.recv(1024)
+    peer.sendall(late[8:])
+    time.sleep(0.05)
+    thread = respond_after(peer, make_reply("7000"))
+    assert controller.read_voltage() == 7000.0
+    thread.join(1.0)
+
+def test_timeout_then_peer_close(link):
+    """Test a half-closed peer drops the connection instead of spinning the drain."""
+    controller, peer = link
+    controller.sock.settimeout(0.1)
+    assert controller.read_pressure() == "TIMEOUT"
+    peer.recv(1024)
+    peer.shutdown(socket.SHUT_WR)
+    time.sleep(0.05)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(controller.read_pressure()),
+                              daemon=True)
+    thread.start()
+    thread.join(2.0)
+    assert not thread.is_alive()
+    assert result == ["NOT CONNECTED"]
+    assert not controller.is_connected()
+
+def test_min_gap(link):
+    """Test the minimum gap between transmissions is honored."""
+    controller, _ = link
+    controller.min_gap = 0.2
+    start = time.monotonic()
+    controller.reset()
+    controller.reset()
+    assert time.monotonic() - start >= 0.19
+
+def test_extract_values():
+    """Test numeric extraction from controller responses."""
+    assert extract_float_from_response("01 OK 00 5.3E-06 9C") == 5.3e-06
+    assert extract_float_from_response("01 OK 00 7000V 9C") == 7000.0
+    assert extract_int_from_response("01 OK 00 0075 9C") == 75
+    assert extract_int_from_response("01 OK 00 75L/S 9C") == 75
+    assert extract_float_from_response("01 OK 00 nan 9C") is None
+    assert extract_float_from_response(b"01 OK 00 inf 9C") is None
+    assert extract_float_from_response("01 OK 00 1_0 9C") == 1.0
+    assert extract_int_from_response("01 OK 00 1_0 9C") == 1
+    assert extract_int_from_response(b"01 OK 00 1_0 9C") == 1
+
+def test_create_command():
+    """Test command framing and checksum."""
+    controller = SpceController(bus_address=5)
+    assert controller.create_command(0x0B) == b"~ 05 0B 37\r"
+    assert controller.create_command(0x0E, "T") == b"~ 05 0E T AE\r"
+
+def test_send_many(link):
+    """Test pipelined requests return replies in order."""
+    controller, peer = link
+    controller.max_in_flight = 2
+    peer.sendall(make_reply("7000") + make_reply("1.2E-06") + make_reply("5.3E-09"))
+    assert controller.send_many([0x0C, 0x0A, 0x0B], "F") == [7000.0, 1.2e-06, 5.3e-09]
+    assert recv_frames(peer, 3) == b"~ 01 0C 34\r~ 01 0A 32\r~ 01 0B 33\r"
+
+def test_send_many_timeout_discards_late_replies(link):
+    """Test replies still in flight after a timeout don't shift later reads."""
+    controller, peer = link
+    controller.max_in_flight = 3
+    controller.sock.settimeout(0.1)
+    assert controller.send_many([0x0B, 0x0A, 0x0C], "F") == ["TIMEOUT"] * 3
+    peer.recv(1024)
+    peer.sendall(make_reply("1.0E-08") + make_reply("2.0E-06") + make_reply("7000"))
+    time.sleep(0.05)
+    thread = respond_after(peer, make_reply("3.0E-08"))
+    assert controller.read_pressure() == 3.0e-08
+    thread.join(1.0)
+
+def test_send_many_rejects_zero_in_flight():
+    """Test max_in_flight below 1 is rejected."""
+    controller = SpceController()
+    controller._set_connected(True)
+    controller.max_in_flight = 0
+    with pytest.raises(ValueError):
+        controller.send_many([0x0B])
+
+def test_read_async_simulate():
+    """Test async reads run the blocking request in an executor."""
+    controller = SpceController(simulate=True)
+    controller.connect(host="127.0.0.1", port=50000)
+    assert asyncio.run(controller.read_pressure_async()) == "SIM_RESPONSE"
+
+def test_validate_response():
+    """Test response validation for str and bytes replies."""
+    controller = SpceController()
+    reply = make_reply("5.3E-09").rstrip(b"\r")
+    assert controller.validate_response(reply)
+    assert controller.validate_response(reply.decode('ascii'))
+    assert not controller.validate_response(reply[:-1] + b"0")
+    assert extract_float_from_response(reply) == 5.3e-09
+
+@pytest.mark.parametrize("max_in_flight", [3, 1])
+def test_read_all(max_in_flight, link):
+    """Test read_all sends P/I/V requests and returns values in that order."""
+    controller, peer = link
+    controller.max_in_flight = max_in_flight
+    peer.sendall(make_reply("1.0E-08") + make_reply("2.0E-06") + make_reply("7000"))
+    assert controller.read_all() == (1.0e-08, 2.0e-06, 7000.0)
+    assert recv_frames(peer, 3) == b"~ 01 0B 33\r~ 01 0A 32\r~ 01 0C 34\r"